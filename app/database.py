@@ -2,7 +2,52 @@ import pandas as pd
 import ast
 import re
 
+try:
+    import pyarrow  # noqa: F401
+
+    # Arrow-backed strings store text in contiguous buffers instead of one Python object per cell
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = pd.StringDtype("python")
+
+
 class DataLoader:
+    @staticmethod
+    def display_year(row):
+        """Value shown in the UI 'year' slot: the release year for movies, the artist for music."""
+        if row.get("type") == "music":
+            value = row.get("artist")
+        else:
+            value = row.get("year")
+        if value is None or pd.isna(value):
+            return ""
+        return str(value)
+
+    @staticmethod
+    def compact(df):
+        """Casts the combined catalogue to compact, typed columns."""
+        out = pd.DataFrame(index=df.index)
+        for col in ["title", "description", "image_url"]:
+            if col in df.columns:
+                out[col] = df[col].astype(STRING_DTYPE)
+        out["type"] = df["type"].astype(pd.CategoricalDtype(["movie", "music"]))
+        out["genre"] = df["genre"].astype(STRING_DTYPE).fillna("Media").astype("category")
+        out["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int16")
+        out["artist"] = df["artist"].astype(STRING_DTYPE) if "artist" in df.columns else pd.NA
+        out["popularity"] = (
+            pd.to_numeric(df["popularity"], errors="coerce")
+            .fillna(0)
+            .clip(-(2**31), 2**31 - 1)
+            .round()
+            .astype("int32")
+        )
+        return out
+
+    @staticmethod
+    def memory_mb(df):
+        """Deep memory footprint of a DataFrame in megabytes."""
+        return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
     @staticmethod
     def load_media(movie_path_og, movie_path_new, music_path):
 
@@ -86,7 +131,8 @@ class DataLoader:
                     )
 
                 clean["description"] = descriptions
-                clean["year"] = artist
+                clean["year"] = pd.NA
+                clean["artist"] = artist
                 clean["dedupe_key"] = clean["title"].apply(normalize) + artist.apply(
                     normalize
                 )
@@ -99,6 +145,7 @@ class DataLoader:
                     .fillna("2000")
                 )
                 clean["year"] = yr[0]
+                clean["artist"] = pd.NA
                 clean["dedupe_key"] = clean["title"].apply(normalize) + yr[0].astype(
                     str
                 )
@@ -140,4 +187,4 @@ class DataLoader:
         final = combined.drop_duplicates(subset=["dedupe_key"], keep="first").drop(
             columns=["dedupe_key"]
         )
-        return final.reset_index(drop=True)
+        return DataLoader.compact(final.reset_index(drop=True))
@@ -0,0 +1,136 @@
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+import torch
+from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+SHARD_SIZE = 2048
+CACHE_DIR = "data_cache"
+SHARD_DIR = os.path.join(CACHE_DIR, "embedding_shards")
+
+_worker_model = None
+
+
+def _init_worker(threads):
+    global _worker_model
+    # Cap intra-op threads so N workers don't each spin up one thread per core
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _worker_model = SentenceTransformer(MODEL_NAME, device="cpu")
+
+
+def _encode_shard(shard_path, texts):
+    embeddings = _worker_model.encode(texts, convert_to_tensor=True, show_progress_bar=False)
+    # Write then rename so a crash never leaves a half-written shard that looks complete
+    tmp_path = f"{shard_path}.tmp"
+    torch.save(embeddings.cpu(), tmp_path)
+    os.replace(tmp_path, shard_path)
+    return shard_path
+
+
+def catalogue_shard_dir(source_files, root=SHARD_DIR):
+    """
+    Shard directory for a catalogue built from source_files (in load order). build_embeddings
+    prunes shards outside its plan, so builds over different source lists must not share one.
+    """
+    names = "\n".join(os.path.basename(path) for path in source_files)
+    return os.path.join(root, hashlib.sha1(names.encode("utf-8")).hexdigest()[:12])
+
+
+def plan_shards(descriptions, shard_dir, shard_size=SHARD_SIZE):
+    """
+    Splits descriptions into shards named by position and content hash, so a
+    resumed or re-run build only re-encodes shards whose text changed.
+    """
+    shards = []
+    for start in range(0, len(descriptions), shard_size):
+        texts = descriptions[start : start + shard_size]
+        digest = hashlib.sha1("\n".join(texts).encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(shard_dir, f"shard_{start // shard_size:05d}_{digest}.pt")
+        shards.append((path, texts))
+    return shards
+
+
+def build_embeddings(
+    descriptions,
+    out_path,
+    shard_dir=SHARD_DIR,
+    workers=None,
+    shard_size=SHARD_SIZE,
+    threads_per_worker=None,
+):
+    """Encodes descriptions on a process pool, checkpointing each shard, and writes the assembled tensor."""
+    os.makedirs(shard_dir, exist_ok=True)
+    # Each worker process runs its own tokenizer; the Rust tokenizer pool would oversubscribe the cores
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+    shards = plan_shards(descriptions, shard_dir, shard_size)
+    pending = [(path, texts) for path, texts in shards if not os.path.exists(path)]
+    print(
+        f"🧩 {len(shards)} shards, {len(shards) - len(pending)} already on disk, "
+        f"{len(pending)} to encode on {workers} worker(s) x {threads_per_worker} thread(s)."
+    )
+
+    start = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads_per_worker,),
+        ) as pool:
+            futures = [pool.submit(_encode_shard, path, texts) for path, texts in pending]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                print(f"   ✅ shard {done}/{len(pending)} written")
+    elapsed = time.perf_counter() - start
+    encoded = sum(len(texts) for _, texts in pending)
+    if encoded:
+        print(f"⏱️ Encoded {encoded} descriptions in {elapsed:.1f}s ({encoded / elapsed:.0f}/s).")
+
+    embeddings = torch.cat([torch.load(path) for path, _ in shards]) if shards else torch.empty(0)
+    torch.save(embeddings, out_path)
+
+    # Shards from older catalogue versions are no longer referenced
+    current = {os.path.basename(path) for path, _ in shards}
+    for name in os.listdir(shard_dir):
+        if name.endswith(".pt") and name not in current:
+            os.remove(os.path.join(shard_dir, name))
+    return embeddings
+
+
+if __name__ == "__main__":
+    from app.database import DataLoader
+
+    parser = argparse.ArgumentParser(description="Build media_embeddings.pt from the cached catalogue.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory holding the catalogue CSVs.")
+    parser.add_argument("--out", default="media_embeddings.pt", help="Where to write the assembled tensor.")
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes (default: half the cores).")
+    parser.add_argument("--threads", type=int, default=None, help="Torch threads per worker.")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Descriptions per shard.")
+    args = parser.parse_args()
+
+    sources = [
+        os.path.join(args.cache_dir, "movies_metadata.csv"),
+        os.path.join(args.cache_dir, "TMDB_movie_dataset_v11.csv"),
+        os.path.join(args.cache_dir, "music_data.csv"),
+    ]
+    media_df = DataLoader.load_media(*sources)
+    build_embeddings(
+        media_df["description"].fillna("").tolist(),
+        args.out,
+        shard_dir=catalogue_shard_dir(sources, os.path.join(args.cache_dir, "embedding_shards")),
+        workers=args.workers,
+        shard_size=args.shard_size,
+        threads_per_worker=args.threads,
+    )
+    print(f"✅ Wrote {len(media_df)} embeddings to {args.out}")
+
+# Run this cmd to (re)build the index; completed shards are reused
+# python -m app.embedding_build --workers 4
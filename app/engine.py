@@ -1,28 +1,37 @@
 import pandas as pd
 import torch
 import os
+import time
 from sentence_transformers import SentenceTransformer, util
 from app.database import DataLoader # Import DataLoader
+from app.personalization import TASTE_WEIGHT, taste_affinity
 
 class RecommendationEngine:
-    def __init__(self):
+    def __init__(self, preload_embeddings=True):
         self.model = SentenceTransformer("all-MiniLM-L6-v2")
         self.media_df = None
         self.embeddings = None
+        # Changes whenever the catalogue or embeddings are (re)loaded; part of response cache keys
+        self.catalogue_version = ""
         # Use absolute path to ensure the engine finds the file downloaded by lifespan
         self.embeddings_path = os.path.abspath("media_embeddings.pt")
 
+        # Shared-snapshot workers attach later instead of loading a private copy
+        if not preload_embeddings:
+            return
         if os.path.exists(self.embeddings_path):
             print(f"✅ Pre-loaded embeddings found at: {self.embeddings_path}")
             self.embeddings = torch.load(self.embeddings_path)
         else:
             print(f"❌ No pre-loaded embeddings found at: {self.embeddings_path}")
 
-    def init_data(self, movie_path_og, movie_path_new, music_path):
+    def init_data(self, movie_path_og, movie_path_new, music_path, version=None):
         # Always reset index so the row numbers (0, 1, 2...) match the embeddings exactly
         self.media_df = DataLoader.load_media(
             movie_path_og, movie_path_new, music_path
         ).reset_index(drop=True)
+        print(f"📦 Catalogue in memory: {DataLoader.memory_mb(self.media_df):.1f} MB")
+        self.catalogue_version = version or str(time.time_ns())
 
         # FIX: Only generate new embeddings if NONE exist.
         # If they exist but counts differ, we use them anyway to keep the app fast.
@@ -40,6 +49,13 @@ class RecommendationEngine:
                 "Skipping re-generation to save time. New items will be searchable after the next Daily Sync."
             )
 
+    def attach(self, media_df, embeddings, version=None):
+        """Uses an already prepared catalogue and embeddings (e.g. memory-mapped from a shared snapshot)."""
+        self.media_df = media_df
+        self.embeddings = embeddings
+        self.catalogue_version = version or str(time.time_ns())
+        print(f"✅ Attached to shared catalogue: {len(media_df)} items, {len(embeddings)} vectors.")
+
     def _prepare_embeddings(self):
         if self.media_df is None:
             return
@@ -62,8 +78,8 @@ class RecommendationEngine:
                 "id": item_id,
                 "title": row['title'],
                 "type": row['type'],
-                "year": row['year'], # Use 'year' for both, which is artist for music
-                "image_url": row['image_url'] if 'image_url' in row else None # Will be fetched dynamically
+                "year": DataLoader.display_year(row), # Release year for movies, artist for music
+                "image_url": row['image_url'] if pd.notna(row.get('image_url')) else None # Will be fetched dynamically
             })
         return results
 
@@ -71,11 +87,12 @@ class RecommendationEngine:
         """Manually trigger a reload of the embeddings file from disk."""
         if os.path.exists(self.embeddings_path):
             self.embeddings = torch.load(self.embeddings_path)
+            self.catalogue_version = str(time.time_ns())
             print(f"✅ Embeddings successfully reloaded from: {self.embeddings_path}")
         else:
             print("❌ Reload failed: File not found.")
 
-    def search_advanced(self, query, media_type="all", page=1, page_size=12):
+    def search_advanced(self, query, media_type="all", page=1, page_size=12, taste=None):
         if self.media_df is None or self.embeddings is None:
             return pd.DataFrame()
 
@@ -130,8 +147,15 @@ class RecommendationEngine:
             results_df = search_df.iloc[final_indices].copy()
             results_df["score"] = scores
 
-        # Sort and paginate as before
-        sorted_df = results_df.sort_values(by="score", ascending=False)
+        # Sort and paginate as before; a session taste nudges the order but not the shown score
+        if taste is not None:
+            affinity = taste_affinity(self.embeddings, results_df.index.tolist(), taste)
+            results_df["rank_score"] = results_df["score"] + TASTE_WEIGHT * affinity.numpy()
+            sorted_df = results_df.sort_values(by="rank_score", ascending=False).drop(
+                columns=["rank_score"]
+            )
+        else:
+            sorted_df = results_df.sort_values(by="score", ascending=False)
         start_index = (page - 1) * page_size
         end_index = start_index + page_size
 
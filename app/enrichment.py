@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+
+
+class EnrichmentStore:
+    """
+    URLs resolved at request time (posters, trailers, previews), keyed by the
+    catalogue row id so reads and writes never scan engine.media_df.
+    """
+
+    FIELDS = ("image_url", "trailer_url", "preview_url")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = {field: {} for field in self.FIELDS}
+        self._key_index = {}
+        self.catalogue_size = 0
+        # Row ids are only meaningful for the catalogue they were resolved against
+        self.catalogue_version = ""
+
+    def index_catalogue(self, media_df, version):
+        """Builds the (title, year-or-artist) -> id lookup used by endpoints that only know the title."""
+        year_or_artist = media_df["year"].astype("string").where(
+            media_df["type"] != "music", media_df["artist"]
+        ).fillna("")
+        key_index = {}
+        for item_id, title, key in zip(media_df.index, media_df["title"], year_or_artist):
+            key_index.setdefault((str(title), str(key)), item_id)
+        with self._lock:
+            self._key_index = key_index
+            self.catalogue_size = len(media_df)
+            self.catalogue_version = version
+
+    def resolve_id(self, title, year):
+        return self._key_index.get((title, year))
+
+    def get(self, item_id, field):
+        if item_id is None:
+            return ""
+        return self._columns[field].get(item_id, "")
+
+    def set(self, item_id, field, url):
+        if item_id is None or not url:
+            return
+        with self._lock:
+            self._columns[field][item_id] = url
+
+    def merge(self, item_id, item_dict):
+        """Fills empty URL fields of item_dict from the store in place."""
+        for field in self.FIELDS:
+            if not item_dict.get(field):
+                stored = self.get(item_id, field)
+                if stored:
+                    item_dict[field] = stored
+        return item_dict
+
+    def save(self, path):
+        """
+        Merges this store into the file at path (our URLs win) so processes sharing it
+        don't drop each other's entries. Those processes must hold a common lock around it.
+        """
+        saved = self._read(path)
+        if saved.get("catalogue_version") != self.catalogue_version:
+            saved = {}
+        with self._lock:
+            columns = {}
+            for field, values in self._columns.items():
+                columns[field] = dict(saved.get("columns", {}).get(field, {}))
+                columns[field].update({str(k): v for k, v in values.items()})
+            payload = {
+                "catalogue_version": self.catalogue_version,
+                "catalogue_size": self.catalogue_size,
+                "columns": columns,
+            }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"❌ Could not read enrichment store {path}: {e}")
+            return {}
+
+    def load(self, path):
+        """Loads a saved store; ignored when it was written for a different catalogue version."""
+        payload = self._read(path)
+        if not payload:
+            return False
+        if (
+            payload.get("catalogue_version") != self.catalogue_version
+            or payload.get("catalogue_size") != self.catalogue_size
+        ):
+            print("⚠️ Enrichment store belongs to a different catalogue snapshot, skipping.")
+            return False
+        with self._lock:
+            for field in self.FIELDS:
+                values = payload.get("columns", {}).get(field, {})
+                self._columns[field] = {int(k): v for k, v in values.items()}
+        return True
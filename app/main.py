@@ -4,17 +4,21 @@ import pandas as pd
 import httpx
 import math
 import asyncio
+import torch
 from contextlib import asynccontextmanager
-import shutil
 from fastapi import FastAPI, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from . import snapshot
 from .database import DataLoader
+from .enrichment import EnrichmentStore
 from .engine import RecommendationEngine
-from .models import SearchResponse
-from .youtube_tool import YoutubeToolset
-from huggingface_hub import hf_hub_download
+from .models import Interaction, SearchResponse
+from .personalization import taste_affinity, TasteStore
+from .response_cache import CachePolicy, ResponseCacheMiddleware
+from .youtube_tool import YoutubeToolset, youtube_search_link
+from .upstream import INTERACTIVE, run_upstream, upstream_priority
 from dotenv import load_dotenv  # Import load_dotenv
 
 app = FastAPI()
@@ -25,100 +29,89 @@ app.add_middleware(
     allow_headers=["*"],
     allow_credentials=True,
 )
-engine = RecommendationEngine()
+engine = RecommendationEngine(preload_embeddings=not snapshot.shared_mode())
 youtube_tool = YoutubeToolset()
+enrichment = EnrichmentStore()
+tastes = TasteStore()
+# Kept next to the snapshot it was resolved against
+ENRICHMENT_PATH = os.path.join(snapshot.SNAPSHOT_DIR, snapshot.ENRICHMENT_FILE)
 
 def clean_val(val, default=""):
-    if val is None:
+    if val is None or val is pd.NA:
         return default
     if isinstance(val, float) and math.isnan(val):
         return default
     return str(val)
 
 
-def _update_media_df_with_url(media_type, title, year, url_type, url):
-    if engine.media_df is not None:
-        url = clean_val(url)
-        idx = engine.media_df[
-            (engine.media_df["title"] == title) & (engine.media_df["year"] == year)
-        ].index
-        if not idx.empty:
-            engine.media_df.loc[idx, url_type] = url
-
-
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     # --- STARTUP LOGIC ---
     print("\n" + "=" * 50 + "\n🚀 INITIALIZING ENGINE (LIFESPAN)\n" + "=" * 50)
     load_dotenv()
 
-    DATASET_REPO = "tuannho080213/media_data"
-    DATA_CACHE_DIR = "data_cache" 
-    EMBEDDINGS_FILENAME = "media_embeddings.pt"
-    os.makedirs(DATA_CACHE_DIR, exist_ok=True)
-
-    local_path1 = os.path.join(DATA_CACHE_DIR, "movies_metadata.csv")
-    local_path3 = os.path.join(DATA_CACHE_DIR, "music_data.csv")
-    local_path2 = os.path.join(DATA_CACHE_DIR, "TMDB_movie_dataset_v11.csv")
-
     try:
-        files_to_download = [
-            "movies_metadata.csv",
-            "music_data.csv",
-            "TMDB_movie_dataset_v11.csv",
-        ]
-
-        for f in files_to_download:
-            print(f"📥 Checking/Downloading: {f}...")
-            hf_hub_download(
-                repo_id=DATASET_REPO,
-                filename=f,
-                repo_type="dataset",
-                local_dir=DATA_CACHE_DIR,
-            )
-
-        # SMART EMBEDDING DOWNLOAD
-        try:
-            print(f"📡 Checking Hugging Face for {EMBEDDINGS_FILENAME}...")
-            emb_path = hf_hub_download(
-                repo_id=DATASET_REPO,
-                filename=EMBEDDINGS_FILENAME,
-                repo_type="dataset",
-                token=os.getenv("HF_TOKEN"),
-            )
-            shutil.copy(emb_path, EMBEDDINGS_FILENAME)
-            print("✅ Pre-computed embeddings found and downloaded.")
-            engine.reload_embeddings()
-            engine.init_data(local_path1, local_path2, local_path3)
-        except Exception:
-            print(
-                "ℹ️ No embeddings found on HF. Engine will check local or create new ones."
-            )
+        if snapshot.shared_mode():
+            # The supervisor normally prepared it already; otherwise the first worker
+            # through the lock downloads and builds while the rest wait, then all attach
+            with snapshot.prepare_lock():
+                if snapshot.read_manifest() is None:
+                    snapshot.prepare()
+            engine.attach(*snapshot.load(), version=snapshot.read_manifest()["version"])
+        else:
+            csv_paths, embeddings_found = snapshot.download_sources()
+            if embeddings_found:
+                engine.reload_embeddings()
 
-        # Init Engine
-        engine.init_data(local_path1, local_path2, local_path3)
+            # Init Engine
+            engine.init_data(*csv_paths, version=snapshot.source_version(csv_paths))
         print(f"✅ SUCCESS: Loaded {len(engine.media_df)} items.")
 
+        enrichment.index_catalogue(engine.media_df, engine.catalogue_version)
+        if enrichment.load(ENRICHMENT_PATH):
+            print(f"✅ Enrichment store restored from: {ENRICHMENT_PATH}")
+
     except Exception as e:
         print(f"❌ ERROR: Startup failed: {e}")
     print("=" * 50 + "\n")
 
     yield  # --- APP IS RUNNING ---
 
-    # --- SHUTDOWN LOGIC (Optional) ---
+    # --- SHUTDOWN LOGIC ---
     print("Shutting down...")
+    if enrichment.catalogue_size:
+        # Every worker saves at shutdown; the lock serializes their read-merge-write
+        with snapshot.prepare_lock():
+            enrichment.save(ENRICHMENT_PATH)
 
 
 # 2. Pass the lifespan to the FastAPI app
 app = FastAPI(lifespan=lifespan)
+# Read-mostly endpoints: fresh for ttl seconds, then served stale for up to stale_ttl while refreshing
+app.add_middleware(
+    ResponseCacheMiddleware,
+    policies={
+        "/trending": CachePolicy(ttl=30, stale_ttl=300, revalidate=True),
+        "/autocomplete": CachePolicy(ttl=300, stale_ttl=3600),
+        "/search": CachePolicy(ttl=300, stale_ttl=3600, revalidate=True),
+        "/config": CachePolicy(ttl=3600),
+    },
+    version_key=lambda params: (
+        engine.catalogue_version,
+        tastes.generation(params.get("session")),
+    ),
+    has_taste=lambda session: tastes.get(session) is not None,
+)
 
 # --- THE OPTIMIZATION WORKER (remains unchanged) ---
 async def get_details_parallel(client, item):
     """Processes a single item (pd.Series) and ensures all URLs are present."""
     await asyncio.sleep(random.uniform(0.1, 0.3))
+    item_id = item.name
     item_dict = {
+        "id": int(item_id),
         "title": clean_val(item.get("title")),
-        "year": clean_val(item.get("year")),
+        "year": DataLoader.display_year(item),
         "type": clean_val(item.get("type")),
         "description": clean_val(item.get("description")),
         "genre": clean_val(item.get("genre")),
@@ -126,38 +119,52 @@ async def get_details_parallel(client, item):
         "score": float(item.get("score", 1.0)),
         "image_url": clean_val(item.get("image_url", "")),
     }
+    enrichment.merge(item_id, item_dict)
 
     if not item_dict["image_url"]:
         if item_dict["type"] == "movie":
-            item_dict["image_url"] = await asyncio.to_thread(
+            item_dict["image_url"] = await run_upstream(
                 youtube_tool.get_movie_image_url, item_dict["title"]
             )
         elif item_dict["type"] == "music":
-            item_dict["image_url"] = await asyncio.to_thread(
+            item_dict["image_url"] = await run_upstream(
                 youtube_tool.get_music_image_url, item_dict["title"], item_dict["year"]
             )
+        enrichment.set(item_id, "image_url", item_dict["image_url"])
 
     if item_dict["type"] == "movie":
-        trailer_url = clean_val(item.get("trailer_url", ""))
+        trailer_url = clean_val(item.get("trailer_url", "")) or enrichment.get(
+            item_id, "trailer_url"
+        )
         if not trailer_url:
-            trailer_url = await asyncio.to_thread(
-                youtube_tool.find_trailer_url, item_dict["title"], item_dict["year"]
+            trailer_url = clean_val(
+                await run_upstream(
+                    youtube_tool.find_trailer_url, item_dict["title"], item_dict["year"]
+                )
             )
+            # The search link is what a tripped breaker (or an empty scrape) falls back to;
+            # keep it out of the store so the real trailer is picked up once YouTube recovers
+            if trailer_url != youtube_search_link(item_dict["title"], item_dict["year"]):
+                enrichment.set(item_id, "trailer_url", trailer_url)
         item_dict["trailer_url"] = clean_val(trailer_url)
 
     if item_dict["type"] == "music":
-        item_dict["preview_url"] = ""
+        item_dict["preview_url"] = enrichment.get(item_id, "preview_url")
 
     return item_dict
 
 @app.get("/preview")
 async def get_preview_url(title: str, artist: str):
     """New endpoint to fetch a music preview URL on-demand."""
-    preview_url = await asyncio.to_thread(
-        youtube_tool.get_music_preview_url, title, artist
-    )
+    item_id = enrichment.resolve_id(title, artist)
+    preview_url = enrichment.get(item_id, "preview_url")
+    if not preview_url:
+        # One iTunes record carries both the preview and the artwork
+        track = await run_upstream(youtube_tool.get_music_track, title, artist)
+        preview_url = track.get("preview_url", "")
+        enrichment.set(item_id, "image_url", track.get("artwork", {}).get(600, ""))
     if preview_url:
-        _update_media_df_with_url("music", title, artist, "preview_url", preview_url)
+        enrichment.set(item_id, "preview_url", preview_url)
         return {"url": preview_url}
     return {"url": None}
 
@@ -175,14 +182,17 @@ async def autocomplete(q: str = Query(..., min_length=1)):
     # Prepare tasks for fetching image URLs concurrently for ALL raw suggestions
     image_fetch_tasks = []
     for item in suggestions_raw:
-        if item["type"] == "movie":
+        enrichment.merge(item["id"], item)
+        if item["image_url"]:
+            image_fetch_tasks.append(asyncio.sleep(0, result=item["image_url"]))
+        elif item["type"] == "movie":
             image_fetch_tasks.append(
-                asyncio.to_thread(youtube_tool.get_movie_image_url, item["title"])
+                run_upstream(youtube_tool.get_movie_image_url, item["title"])
             )
         elif item["type"] == "music":
-            # 'year' column in media_df for music stores artist name
+            # The suggestion's 'year' slot carries the artist name for music
             image_fetch_tasks.append(
-                asyncio.to_thread(
+                run_upstream(
                     youtube_tool.get_music_image_url, item["title"], item["year"]
                 )
             )
@@ -191,11 +201,14 @@ async def autocomplete(q: str = Query(..., min_length=1)):
                 asyncio.to_thread(lambda: None)
             )  # Placeholder for unknown types
 
-    fetched_image_urls = await asyncio.gather(*image_fetch_tasks)
+    # Keystroke lookups jump ahead of card and background calls in the per-host queues
+    with upstream_priority(INTERACTIVE):
+        fetched_image_urls = await asyncio.gather(*image_fetch_tasks)
 
     # Assign fetched image URLs back to the suggestions_raw
     for i, item in enumerate(suggestions_raw):
         item["image_url"] = fetched_image_urls[i]
+        enrichment.set(item["id"], "image_url", clean_val(item["image_url"]))
 
     final_movie_suggestions = []
     final_music_suggestions = []
@@ -209,8 +222,17 @@ async def autocomplete(q: str = Query(..., min_length=1)):
     return {"movies": final_movie_suggestions, "music": final_music_suggestions}
 
 
+@app.post("/interaction")
+def record_interaction(event: Interaction):
+    """Called when a user opens a trailer, plays a preview or picks a suggestion."""
+    if engine.embeddings is None or not 0 <= event.item_id < len(engine.embeddings):
+        return {"ok": False}
+    tastes.record(event.session, engine.embeddings[event.item_id])
+    return {"ok": True}
+
+
 @app.get("/trending")
-async def get_trending(type: str = "all", limit: int = 15, page: int = 1):
+async def get_trending(type: str = "all", limit: int = 15, page: int = 1, session: str = None):
     if engine.media_df is None:
         return {"results": []}
 
@@ -221,7 +243,17 @@ async def get_trending(type: str = "all", limit: int = 15, page: int = 1):
     else:
         pool = engine.media_df
 
-    sample = pool.nlargest(250, "popularity").sample(n=min(limit, len(pool)))
+    candidates = pool.nlargest(250, "popularity")
+    n = min(limit, len(candidates))
+    taste = tastes.get(session)
+    if taste is None:
+        sample = candidates.sample(n=n)
+    else:
+        # Still random, but items close to the session's taste are drawn more often.
+        # Weighted draw without replacement (Efraimidis-Spirakis): keep the n largest u ** (1 / w)
+        affinity = taste_affinity(engine.embeddings, candidates.index.tolist(), taste)
+        keys = torch.rand(len(candidates)) ** (1 / torch.exp(affinity * 5))
+        sample = candidates.iloc[torch.topk(keys, n).indices.tolist()]
 
     async with httpx.AsyncClient() as client:
         tasks = [get_details_parallel(client, item) for _, item in sample.iterrows()]
@@ -232,8 +264,10 @@ async def get_trending(type: str = "all", limit: int = 15, page: int = 1):
 
 
 @app.get("/search", response_model=SearchResponse)
-async def search_api(q: str, type: str = "all", page: int = 1):
-    results_df = engine.search_advanced(query=q, media_type=type, page=page)
+async def search_api(q: str, type: str = "all", page: int = 1, session: str = None):
+    results_df = engine.search_advanced(
+        query=q, media_type=type, page=page, taste=tastes.get(session)
+    )
 
     if results_df.empty:
         return {"query": q, "count": 0, "results": []}
@@ -247,19 +281,25 @@ async def search_api(q: str, type: str = "all", page: int = 1):
     return {"query": q, "count": len(formatted), "results": formatted}
 
 
+@app.get("/upstream/metrics")
+def get_upstream_metrics():
+    """Per-host counters for calls, queued, dropped and circuit-breaker trips."""
+    return youtube_tool.scheduler.stats()
+
+
+@app.get("/health")
+def get_health():
+    return {
+        "pid": os.getpid(),
+        "items": 0 if engine.media_df is None else len(engine.media_df),
+        "shared": snapshot.shared_mode(),
+    }
+
+
 @app.get("/config")
 def get_config():
     return {"TMDB_API_KEY": os.getenv("TMDB_API_KEY", "")}
 
-def _update_media_df_with_url(media_type, title, year, url_type, url):
-    if engine.media_df is not None:
-        url = clean_val(url)
-        idx = engine.media_df[
-            (engine.media_df["title"] == title) & (engine.media_df["year"] == year)
-        ].index
-        if not idx.empty:
-            engine.media_df.loc[idx, url_type] = url
-
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.get("/")
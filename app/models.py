@@ -3,6 +3,7 @@ from typing import List, Optional
 
 
 class MediaResult(BaseModel):
+    id: Optional[int] = None
     title: str
     type: str
     description: str
@@ -19,3 +20,8 @@ class SearchResponse(BaseModel):
     query: str
     count: int
     results: List[MediaResult]
+
+
+class Interaction(BaseModel):
+    session: str
+    item_id: int
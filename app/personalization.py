@@ -0,0 +1,60 @@
+import threading
+import torch
+from cachetools import TTLCache
+
+# How fast a session's taste follows its latest clicks (EMA weight of the new item)
+TASTE_ALPHA = 0.3
+# How much taste affinity may move a candidate relative to its base score
+TASTE_WEIGHT = 0.15
+MAX_SESSIONS = 10_000
+SESSION_TTL = 60 * 60  # seconds of inactivity before a session's taste is forgotten
+
+
+class TasteStore:
+    """Per-session taste vectors: an exponential moving average over embeddings of clicked items."""
+
+    def __init__(self, maxsize=MAX_SESSIONS, ttl=SESSION_TTL, alpha=TASTE_ALPHA):
+        self._tastes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.alpha = alpha
+
+    def record(self, session_id, item_embedding):
+        """Folds one clicked item into the session's taste; O(embedding dim)."""
+        item_embedding = item_embedding.float()
+        item_embedding = item_embedding / (item_embedding.norm() + 1e-8)
+        with self._lock:
+            taste, generation = self._tastes.get(session_id, (None, 0))
+            if taste is None:
+                taste = item_embedding.clone()
+            else:
+                taste = (1 - self.alpha) * taste + self.alpha * item_embedding
+            # Re-assigning also refreshes the TTL
+            self._tastes[session_id] = (taste / (taste.norm() + 1e-8), generation + 1)
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        with self._lock:
+            return self._tastes.get(session_id, (None, 0))[0]
+
+    def generation(self, session_id):
+        """Number of clicks folded into the session's taste; changes whenever its ranking can."""
+        if not session_id:
+            return 0
+        with self._lock:
+            return self._tastes.get(session_id, (None, 0))[1]
+
+    def __len__(self):
+        return len(self._tastes)
+
+
+def taste_affinity(embeddings, item_ids, taste):
+    """One dot product per candidate; ids beyond the embedding table score 0."""
+    scores = torch.zeros(len(item_ids))
+    if taste is None or embeddings is None:
+        return scores
+    valid = [i for i, item_id in enumerate(item_ids) if 0 <= item_id < len(embeddings)]
+    if valid:
+        rows = embeddings[[int(item_ids[i]) for i in valid]].float()
+        scores[valid] = (rows @ taste.to(rows.device)).cpu()
+    return scores
@@ -0,0 +1,279 @@
+import asyncio
+import gzip
+import hashlib
+import time
+from dataclasses import dataclass, field
+from urllib.parse import parse_qsl
+from cachetools import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MAX_ENTRIES = 2048
+MIN_COMPRESS_BYTES = 512
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+STATIC_MAX_AGE = 3600
+
+
+@dataclass
+class CachePolicy:
+    ttl: float  # seconds a response is served as fresh
+    stale_ttl: float = 0  # extra seconds it may be served while a refresh runs in the background
+    # Make browsers revalidate every time (ETag/304) instead of reusing the body for ttl;
+    # for endpoints whose body can change behind the same URL, e.g. after a session's click
+    revalidate: bool = False
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    headers: list
+    etag: str
+    created: float = field(default_factory=time.monotonic)
+    encoded: dict = field(default_factory=dict)
+
+
+def _encode(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _pick_encoding(accept_encoding):
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _is_compressible(headers):
+    content_type = dict(headers).get(b"content-type", b"").decode("latin-1")
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+async def _collect(app, scope):
+    """Runs the app for scope with an empty body and returns (status, headers, body)."""
+    start = {}
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return start.get("status", 500), list(start.get("headers", [])), b"".join(chunks)
+
+
+class ResponseCacheMiddleware:
+    """
+    In-memory cache for read-mostly GET endpoints, plus compression for everything it serves.
+
+    Cached responses are keyed by path, normalized query parameters and the value of
+    version_key(params) (catalogue snapshot version, session taste generation, ...), so a
+    new catalogue or a changed taste never serves an old body. Responses carry a strong
+    ETag; a matching If-None-Match gets a bodiless 304. Within stale_ttl after expiry the
+    old body is served immediately while one background request rebuilds it.
+
+    has_taste(session) tells whether a session's responses are personalized; sessions
+    without a taste share the anonymous entries.
+    """
+
+    def __init__(self, app, policies, version_key=None, has_taste=None, maxsize=MAX_ENTRIES):
+        self.app = app
+        self.policies = policies
+        self.version_key = version_key or (lambda params: "")
+        self.has_taste = has_taste or (lambda session: False)
+        self.entries = LRUCache(maxsize=maxsize)
+        self.refreshing = set()
+        self.tasks = set()
+        # key -> task filling it, so concurrent misses on one key run the app once
+        self.filling = {}
+        self.static_encoded = LRUCache(maxsize=256)
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "coalesced": 0, "not_modified": 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policies.get(scope["path"])
+        if policy is None:
+            await self._passthrough(scope, receive, send)
+            return
+
+        params = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        personal = self.has_taste(params.get("session"))
+        key = self._key(scope["path"], params, personal)
+        entry = self.entries.get(key)
+        now = time.monotonic()
+        age = now - entry.created if entry else None
+
+        if entry is not None and age <= policy.ttl:
+            self.stats["hits"] += 1
+            await self._respond(scope, send, entry, policy, "HIT", personal)
+            return
+        if entry is not None and age <= policy.ttl + policy.stale_ttl:
+            self.stats["stale"] += 1
+            if key not in self.refreshing:
+                self.refreshing.add(key)
+                task = asyncio.create_task(self._refresh(scope, key))
+                # Keep a reference so the refresh isn't garbage-collected mid-flight
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            await self._respond(scope, send, entry, policy, "STALE", personal)
+            return
+
+        fill = self.filling.get(key)
+        if fill is None:
+            self.stats["misses"] += 1
+            fill = asyncio.create_task(self._fill(scope, key))
+            self.filling[key] = fill
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded so one client disconnecting doesn't cancel the fill the others wait on
+        status, headers, body, entry = await asyncio.shield(fill)
+        if entry is None:
+            # Errors are passed through as-is and never cached
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+        await self._respond(scope, send, entry, policy, "MISS", personal)
+
+    def _key(self, path, params, personal):
+        """
+        The session parameter is part of the key only for personal requests, i.e. sessions
+        that have a taste vector. Any other session gets the same body as anonymous traffic,
+        so it is dropped and identical queries from every such tab share one entry.
+        """
+        normalized = []
+        for name, value in sorted(params.items()):
+            if name == "session" and not personal:
+                continue
+            value = " ".join(value.split())
+            # Search and autocomplete are case-insensitive (the encoder is uncased)
+            if name == "q":
+                value = value.lower()
+            normalized.append((name, value))
+        return (path, tuple(normalized), self.version_key(params))
+
+    async def _fill(self, scope, key):
+        try:
+            status, headers, body = await _collect(self.app, self._scope_for_fill(scope))
+            entry = self._store(key, headers, body) if status == 200 else None
+            return status, headers, body, entry
+        finally:
+            self.filling.pop(key, None)
+
+    def _scope_for_fill(self, scope):
+        headers = [
+            (k, v) for k, v in scope["headers"] if k not in (b"if-none-match", b"accept-encoding")
+        ]
+        return {**scope, "headers": headers}
+
+    def _store(self, key, headers, body):
+        headers = [(k, v) for k, v in headers if k not in (b"content-length", b"etag")]
+        entry = CachedResponse(body=body, headers=headers, etag=f'"{hashlib.sha1(body).hexdigest()}"')
+        self.entries[key] = entry
+        return entry
+
+    async def _refresh(self, scope, key):
+        try:
+            status, headers, body = await _collect(self.app, self._scope_for_fill(scope))
+            if status == 200:
+                self._store(key, headers, body)
+        except Exception as e:
+            print(f"⚠️ Background refresh failed for {scope['path']}: {e}")
+        finally:
+            self.refreshing.discard(key)
+
+    def _request_header(self, scope, name):
+        for k, v in scope["headers"]:
+            if k == name:
+                return v.decode("latin-1")
+        return ""
+
+    async def _respond(self, scope, send, entry, policy, cache_status, personal=False):
+        visibility = "private" if personal else "public"
+        if policy.revalidate:
+            cache_control = f"{visibility}, no-cache"
+        else:
+            cache_control = (
+                f"{visibility}, max-age={int(policy.ttl)}, "
+                f"stale-while-revalidate={int(policy.stale_ttl)}"
+            )
+        headers = [
+            (b"etag", entry.etag.encode()),
+            (b"cache-control", cache_control.encode()),
+            (b"vary", b"Accept-Encoding"),
+            (b"x-cache", cache_status.encode()),
+        ]
+        if entry.etag in self._request_header(scope, b"if-none-match"):
+            self.stats["not_modified"] += 1
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        body = entry.body
+        encoding = _pick_encoding(self._request_header(scope, b"accept-encoding"))
+        if encoding and len(body) >= MIN_COMPRESS_BYTES and _is_compressible(entry.headers):
+            if encoding not in entry.encoded:
+                entry.encoded[encoding] = _encode(body, encoding)
+            body = entry.encoded[encoding]
+            headers.append((b"content-encoding", encoding.encode()))
+
+        headers += entry.headers + [(b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _passthrough(self, scope, receive, send):
+        """Uncached routes (static files, index): add compression and a max-age to text responses."""
+        encoding = _pick_encoding(self._request_header(scope, b"accept-encoding"))
+        is_static = scope["path"] == "/" or scope["path"].startswith("/static/")
+        if encoding is None and not is_static:
+            await self.app(scope, receive, send)
+            return
+
+        start = {}
+        chunks = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        body = b"".join(chunks)
+        headers = [(k, v) for k, v in start.get("headers", []) if k != b"content-length"]
+        if is_static and start.get("status") in (200, 304):
+            headers.append((b"cache-control", f"public, max-age={STATIC_MAX_AGE}".encode()))
+        if (
+            encoding
+            and start.get("status") == 200
+            and len(body) >= MIN_COMPRESS_BYTES
+            and _is_compressible(headers)
+            and b"content-encoding" not in dict(headers)
+        ):
+            etag = dict(headers).get(b"etag")
+            if etag is not None:
+                # Static files carry an ETag, so their compressed bytes can be reused
+                cache_key = (scope["path"], etag, encoding)
+                if cache_key not in self.static_encoded:
+                    self.static_encoded[cache_key] = _encode(body, encoding)
+                body = self.static_encoded[cache_key]
+            else:
+                body = _encode(body, encoding)
+            headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+        if start.get("status") != 304:
+            headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": start.get("status", 500), "headers": headers})
+        await send({"type": "http.response.body", "body": body})
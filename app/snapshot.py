@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import warnings
+from contextlib import contextmanager
+import numpy as np
+import pyarrow as pa
+import torch
+from huggingface_hub import hf_hub_download
+from .database import STRING_DTYPE, DataLoader
+
+DATASET_REPO = "tuannho080213/media_data"
+DATA_CACHE_DIR = "data_cache"
+EMBEDDINGS_FILENAME = "media_embeddings.pt"
+SOURCE_FILES = ["movies_metadata.csv", "TMDB_movie_dataset_v11.csv", "music_data.csv"]
+
+SNAPSHOT_DIR = os.path.join(DATA_CACHE_DIR, "snapshot")
+CATALOGUE_FILE = "catalogue.arrow"
+VECTORS_FILE = "embeddings.npy"
+MANIFEST_FILE = "manifest.json"
+ENRICHMENT_FILE = "enrichment.json"
+LOCK_FILE = os.path.join(DATA_CACHE_DIR, ".prepare.lock")
+
+# Set by the supervisor so every uvicorn worker attaches to the snapshot instead of loading its own copy
+SHARED_ENV = "MEDIA_SHARED_SNAPSHOT"
+
+
+def shared_mode():
+    return os.getenv(SHARED_ENV) == "1"
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock_file(f):
+        # LK_LOCK gives up after ~10s, so keep retrying until the holder releases it
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def prepare_lock(path=LOCK_FILE):
+    """Cross-process lock so only one worker downloads data or builds the snapshot at a time."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def download_sources(cache_dir=DATA_CACHE_DIR):
+    """
+    Fetches the catalogue CSVs (and the pre-computed embeddings when the Hub has them).
+    Returns the three CSV paths and whether embeddings were downloaded.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    for f in SOURCE_FILES:
+        print(f"📥 Checking/Downloading: {f}...")
+        hf_hub_download(
+            repo_id=DATASET_REPO,
+            filename=f,
+            repo_type="dataset",
+            local_dir=cache_dir,
+        )
+
+    # SMART EMBEDDING DOWNLOAD
+    embeddings_found = False
+    try:
+        print(f"📡 Checking Hugging Face for {EMBEDDINGS_FILENAME}...")
+        emb_path = hf_hub_download(
+            repo_id=DATASET_REPO,
+            filename=EMBEDDINGS_FILENAME,
+            repo_type="dataset",
+            token=os.getenv("HF_TOKEN"),
+        )
+        # copy2 keeps the cached blob's mtime, so an unchanged Hub file keeps the snapshot fingerprint
+        if not _same_file_stat(emb_path, EMBEDDINGS_FILENAME):
+            shutil.copy2(emb_path, EMBEDDINGS_FILENAME)
+        print("✅ Pre-computed embeddings found and downloaded.")
+        embeddings_found = True
+    except Exception:
+        print("ℹ️ No embeddings found on HF. Engine will check local or create new ones.")
+
+    return [os.path.join(cache_dir, f) for f in SOURCE_FILES], embeddings_found
+
+
+def _same_file_stat(src, dst):
+    if not os.path.exists(dst):
+        return False
+    a, b = os.stat(src), os.stat(dst)
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
+
+
+def _fingerprint(paths):
+    sha = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            sha.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return sha.hexdigest()
+
+
+def source_version(csv_paths):
+    """Version of the catalogue built from csv_paths; changes whenever one of them does."""
+    return _fingerprint(csv_paths)
+
+
+def read_manifest(snapshot_dir=SNAPSHOT_DIR):
+    path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def prepare(cache_dir=DATA_CACHE_DIR, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Downloads sources and (re)writes the shared snapshot if they changed since the last one.
+    Call under prepare_lock(). Returns the snapshot version.
+    """
+    start = time.perf_counter()
+    csv_paths, _ = download_sources(cache_dir)
+    fingerprint = _fingerprint(csv_paths + [os.path.abspath(EMBEDDINGS_FILENAME)])
+    manifest = read_manifest(snapshot_dir)
+    if manifest and manifest.get("version") == fingerprint:
+        print(f"✅ Snapshot {fingerprint[:8]} is current.")
+        return fingerprint
+
+    media_df = DataLoader.load_media(*csv_paths).reset_index(drop=True)
+    if os.path.exists(EMBEDDINGS_FILENAME):
+        embeddings = torch.load(EMBEDDINGS_FILENAME, map_location="cpu")
+    else:
+        from .embedding_build import build_embeddings, catalogue_shard_dir
+
+        embeddings = build_embeddings(
+            media_df["description"].fillna("").tolist(),
+            EMBEDDINGS_FILENAME,
+            shard_dir=catalogue_shard_dir(csv_paths),
+        )
+        # Building wrote the .pt file, so fingerprint what the next start will see
+        fingerprint = _fingerprint(csv_paths + [os.path.abspath(EMBEDDINGS_FILENAME)])
+    write(media_df, embeddings, fingerprint, snapshot_dir)
+    print(f"✅ Snapshot {fingerprint[:8]} written in {time.perf_counter() - start:.1f}s.")
+    return fingerprint
+
+
+def write(media_df, embeddings, version, snapshot_dir=SNAPSHOT_DIR):
+    """Writes the catalogue as an uncompressed Arrow IPC file and the vectors as a raw .npy file."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    # A reader only trusts files listed by the manifest, so drop it before replacing them
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    table = pa.Table.from_pandas(media_df, preserve_index=False)
+    catalogue_tmp = os.path.join(snapshot_dir, f"{CATALOGUE_FILE}.tmp")
+    with pa.OSFile(catalogue_tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(catalogue_tmp, os.path.join(snapshot_dir, CATALOGUE_FILE))
+
+    vectors_tmp = os.path.join(snapshot_dir, f"tmp_{VECTORS_FILE}")
+    np.save(vectors_tmp, embeddings.detach().cpu().numpy().astype(np.float32))
+    os.replace(vectors_tmp, os.path.join(snapshot_dir, VECTORS_FILE))
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "rows": len(media_df), "vectors": len(embeddings)}, f)
+
+
+def load(snapshot_dir=SNAPSHOT_DIR):
+    """
+    Attaches to the snapshot read-only. String columns stay in the memory-mapped Arrow
+    buffers and the vectors in the memory-mapped .npy, so the page cache holds one copy
+    shared by every worker.
+    """
+    source = pa.memory_map(os.path.join(snapshot_dir, CATALOGUE_FILE), "r")
+    table = pa.ipc.open_file(source).read_all()
+    media_df = table.to_pandas(
+        types_mapper={pa.string(): STRING_DTYPE, pa.large_string(): STRING_DTYPE}.get
+    )
+
+    vectors = np.load(os.path.join(snapshot_dir, VECTORS_FILE), mmap_mode="r")
+    with warnings.catch_warnings():
+        # torch warns that the array is not writeable; the engine never writes to embeddings
+        warnings.simplefilter("ignore", UserWarning)
+        embeddings = torch.from_numpy(vectors)
+    return media_df, embeddings
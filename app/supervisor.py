@@ -0,0 +1,31 @@
+import argparse
+import os
+import time
+import uvicorn
+from dotenv import load_dotenv
+from . import snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare the shared snapshot once, then serve it from N workers.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7860)
+    args = parser.parse_args()
+
+    load_dotenv()
+    start = time.perf_counter()
+    with snapshot.prepare_lock():
+        version = snapshot.prepare()
+    print(f"🚀 Snapshot {version[:8]} ready in {time.perf_counter() - start:.1f}s, starting {args.workers} worker(s)...")
+
+    # Inherited by the worker processes uvicorn spawns
+    os.environ[snapshot.SHARED_ENV] = "1"
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
+
+# Run this cmd to serve with 4 workers sharing one catalogue and embedding snapshot
+# python -m app.supervisor --workers 4
@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Lower value = served first when a host's bucket is empty
+INTERACTIVE = 0  # autocomplete keystrokes
+NORMAL = 1  # search / trending cards
+BACKGROUND = 2  # cache warming, batch jobs
+
+# run_upstream (like asyncio.to_thread) copies the context, so the priority set by an endpoint follows its calls
+UPSTREAM_PRIORITY = contextvars.ContextVar("upstream_priority", default=NORMAL)
+
+# Per-host limits: sustained rate (calls/sec), burst size, and how long each priority may queue
+HOST_LIMITS = {
+    "itunes.apple.com": {"rate": 1.0, "burst": 20},
+    "api.themoviedb.org": {"rate": 4.0, "burst": 40},
+    "www.youtube.com": {"rate": 2.0, "burst": 10},
+}
+DEFAULT_LIMITS = {"rate": 2.0, "burst": 10}
+MAX_WAIT = {INTERACTIVE: 2.0, NORMAL: 5.0, BACKGROUND: 30.0}
+MAX_QUEUE = 100
+# Threads per priority for run_upstream; interactive calls get a pool of their own
+EXECUTOR_WORKERS = {INTERACTIVE: 4, NORMAL: 16, BACKGROUND: 4}
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling a host that is tripped or too busy to serve in time."""
+
+
+@contextmanager
+def upstream_priority(priority):
+    token = UPSTREAM_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        UPSTREAM_PRIORITY.reset(token)
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(priority):
+    with _executors_lock:
+        if priority not in _executors:
+            _executors[priority] = ThreadPoolExecutor(
+                max_workers=EXECUTOR_WORKERS.get(priority, EXECUTOR_WORKERS[NORMAL]),
+                thread_name_prefix=f"upstream-{priority}",
+            )
+        return _executors[priority]
+
+
+async def run_upstream(fn, *args, **kwargs):
+    """
+    asyncio.to_thread for calls that go through the scheduler. They can sit in a bucket
+    for up to MAX_WAIT, so they run on per-priority pools instead of the default executor:
+    a backlog of card lookups then can't hold an autocomplete call in the executor's FIFO
+    before it even reaches the bucket.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(_executor(UPSTREAM_PRIORITY.get()), call)
+
+
+class TokenBucket:
+    """Token bucket where waiting callers are served in (priority, arrival) order."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiters = []
+        self._seq = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority, max_wait, max_queue):
+        """Returns True if the caller had to queue; raises UpstreamUnavailable when dropped."""
+        with self.cond:
+            if len(self.waiters) >= max_queue:
+                raise UpstreamUnavailable("queue full")
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self.waiters, ticket)
+            deadline = time.monotonic() + max_wait
+            queued = False
+            while True:
+                self._refill()
+                if self.waiters[0] == ticket and self.tokens >= 1:
+                    self.tokens -= 1
+                    heapq.heappop(self.waiters)
+                    self.cond.notify_all()
+                    return queued
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiters.remove(ticket)
+                    heapq.heapify(self.waiters)
+                    self.cond.notify_all()
+                    raise UpstreamUnavailable("timed out waiting for a token")
+                queued = True
+                refill_in = (1 - self.tokens) / self.rate if self.tokens < 1 else remaining
+                self.cond.wait(min(remaining, max(refill_in, 0.01)))
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets traffic probe the host again after a cooldown."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        # True while the single half-open probe is in flight
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Half-open lets exactly one probe through; everyone else fails fast until it reports back."""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def cancel_probe(self):
+        """For a probe that never reached the host (e.g. dropped by the rate limiter)."""
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        """Returns True when this failure trips the breaker."""
+        with self.lock:
+            state = self.state
+            self.failures += 1
+            if state == "open":
+                return False  # a call that started before the trip
+            if state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+                return True
+            return False
+
+
+class UpstreamScheduler:
+    def __init__(self, host_limits=None):
+        self.host_limits = host_limits or HOST_LIMITS
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                limits = self.host_limits.get(host, DEFAULT_LIMITS)
+                self._hosts[host] = {
+                    "bucket": TokenBucket(limits["rate"], limits["burst"]),
+                    "breaker": CircuitBreaker(),
+                    "lock": threading.Lock(),
+                    "metrics": dict.fromkeys(
+                        ["calls", "queued", "dropped", "failures", "tripped", "short_circuited"], 0
+                    ),
+                }
+            return self._hosts[host]
+
+    @staticmethod
+    def _bump(state, key):
+        with state["lock"]:
+            state["metrics"][key] += 1
+
+    def call(self, host, fn):
+        """Runs fn() under the host's rate limit and circuit breaker."""
+        state = self._host(host)
+        if not state["breaker"].allow():
+            self._bump(state, "short_circuited")
+            raise UpstreamUnavailable(f"{host} circuit open")
+
+        priority = UPSTREAM_PRIORITY.get()
+        try:
+            if state["bucket"].acquire(priority, MAX_WAIT.get(priority, MAX_WAIT[NORMAL]), MAX_QUEUE):
+                self._bump(state, "queued")
+        except UpstreamUnavailable:
+            self._bump(state, "dropped")
+            state["breaker"].cancel_probe()
+            raise
+
+        self._bump(state, "calls")
+        try:
+            result = fn()
+        except Exception:
+            self._bump(state, "failures")
+            if state["breaker"].record_failure():
+                self._bump(state, "tripped")
+                print(f"⚠️ Circuit opened for {host}, failing fast for {RESET_TIMEOUT:.0f}s.")
+            raise
+        state["breaker"].record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {
+            host: {
+                "state": state["breaker"].state,
+                "waiting": len(state["bucket"].waiters),
+                **state["metrics"],
+            }
+            for host, state in hosts.items()
+        }
+
+
+def fail_fast(fallback):
+    """
+    Returns fallback (a value, or a callable taking the method's arguments) when the
+    upstream is unavailable. Sits outside lru_cache so placeholders are never cached.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            except UpstreamUnavailable:
+                return fallback(*args, **kwargs) if callable(fallback) else fallback
+
+        return wrapper
+
+    return decorator
@@ -1,17 +1,39 @@
+import contextvars
 import os
 import requests
 from functools import lru_cache
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_search import YoutubeSearch
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus, urlsplit
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from .upstream import BACKGROUND, UpstreamScheduler, UpstreamUnavailable, fail_fast, upstream_priority
+
+
+def _trailer_query(movie_title, year=None):
+    search_query = f"{movie_title} trailer"
+    if year:
+        search_query += f" {year}"
+    return search_query
+
+
+def youtube_search_link(movie_title, year=None):
+    """Direct YouTube search link, the last resort when no trailer video could be picked."""
+    return f"https://www.youtube.com/results?search_query={_trailer_query(movie_title, year).replace(' ', '+')}"
+
+
+# Batch lookups stay well under the iTunes bucket so interactive calls are not starved
+ITUNES_BATCH_WORKERS = 4
+
 
 class YoutubeToolset:
 
     def __init__(self):
         # Setup a robust session to handle cloud network glitches
         self.session = requests.Session()
-        retries = Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504])
+        # A single quick retry; sustained upstream trouble is handled by the circuit breaker
+        retries = Retry(total=1, backoff_factor=0.2, status_forcelist=[502, 503, 504])
         self.session.mount("https://", HTTPAdapter(max_retries=retries))
         # Add a real browser header to avoid being blocked by YouTube
         self.session.headers.update(
@@ -19,6 +41,26 @@ class YoutubeToolset:
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
             }
         )
+        self.scheduler = UpstreamScheduler()
+
+    def _get(self, url):
+        """
+        Rate-limited GET; throttling (429), server errors and transport failures count against
+        the host's breaker and are raised as UpstreamUnavailable, so callers fall back through
+        fail_fast instead of lru_cache memoizing an empty answer for a transient failure.
+        """
+
+        def request():
+            res = self.session.get(url, timeout=5.0)
+            if res.status_code == 429 or res.status_code >= 500:
+                res.raise_for_status()
+            return res
+
+        host = urlsplit(url).hostname
+        try:
+            return self.scheduler.call(host, request)
+        except requests.RequestException as e:
+            raise UpstreamUnavailable(f"{host}: {e}") from e
 
     def search_youtube(self, query):
         """
@@ -27,8 +69,12 @@ class YoutubeToolset:
         """
         try:
             # We use the library but wrap it in a retry-aware environment
-            results = YoutubeSearch(query, max_results=5).to_dict()
+            results = self.scheduler.call(
+                "www.youtube.com", lambda: YoutubeSearch(query, max_results=5).to_dict()
+            )
             return results
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Error searching YouTube for '{query}': {e}")
             return []
@@ -43,21 +89,17 @@ class YoutubeToolset:
             print(f"Error getting transcript for video {video_id}: {e}")
             return None
 
+    @fail_fast(lambda self, movie_title, year=None: youtube_search_link(movie_title, year))
     @lru_cache(maxsize=1024)
     def find_trailer_url(self, movie_title, year=None):
         """
         Searches for a movie trailer on YouTube with multiple fallback levels.
         """
-        search_query = f"{movie_title} trailer"
-        if year:
-            search_query += f" {year}"
-
-        results = self.search_youtube(search_query)
+        results = self.search_youtube(_trailer_query(movie_title, year))
 
         # NEW: If scraping fails, provide a direct search link as a last resort
         if not results:
-            safe_query = search_query.replace(" ", "+")
-            return f"https://www.youtube.com/results?search_query={safe_query}"
+            return youtube_search_link(movie_title, year)
 
         # Level 1: Look for "Official" and "Trailer" in the title (Best Match)
         for result in results:
@@ -76,33 +118,79 @@ class YoutubeToolset:
 
         return None
 
-    @lru_cache(maxsize=2048)
-    def get_music_preview_url(self, song_title, artist_name=""):
+    @lru_cache(maxsize=4096)
+    def resolve_track(self, song_title, artist_name=""):
         """
-        Searches for a music preview URL on iTunes API with fallback queries.
+        Looks a song up on iTunes once and returns the whole track record
+        (artwork sizes, preview URL, genre, trackId), or {} if nothing matched.
+        Artwork and preview lookups are views over this cached record.
+        If the best hit lacks a preview or artwork, the artist-less term fills them in.
         """
         search_terms = []
         if artist_name:
             search_terms.append(f"{song_title} {artist_name}")
         search_terms.append(song_title)
 
+        record = {}
         for term in search_terms:
             try:
-                # Use the robust session instead of bare requests.get
-                res = self.session.get(
-                    f"https://itunes.apple.com/search?term={term}&entity=song&limit=1",
-                    timeout=5.0,
+                res = self._get(
+                    f"https://itunes.apple.com/search?term={quote_plus(term)}&entity=song&limit=1"
                 )
                 res.raise_for_status()
                 data = res.json()
                 if data.get("results"):
-                    preview_url = data["results"][0].get("previewUrl")
-                    if preview_url:
-                        return preview_url
+                    track = data["results"][0]
+                    artwork = track.get("artworkUrl100") or ""
+                    found = {
+                        "track_id": track.get("trackId"),
+                        "title": track.get("trackName"),
+                        "artist": track.get("artistName"),
+                        "genre": track.get("primaryGenreName"),
+                        "preview_url": track.get("previewUrl") or "",
+                        "artwork": {
+                            size: artwork.replace("100x100bb", f"{size}x{size}bb")
+                            for size in (100, 300, 600)
+                        }
+                        if artwork
+                        else {},
+                    }
+                    # The first match wins; later terms only fill fields it is missing
+                    record = {key: record.get(key) or value for key, value in found.items()}
+                    if record["preview_url"] and record["artwork"]:
+                        break
+            except UpstreamUnavailable:
+                raise
             except Exception as e:
-                print(f"Error fetching iTunes preview for '{term}': {e}")
-        return ""
+                # Only a real answer may be memoized; a failed lookup is retried next time
+                print(f"Error fetching iTunes track for '{term}': {e}")
+                raise UpstreamUnavailable(f"iTunes lookup failed for '{term}'") from e
+        return record
+
+    def resolve_tracks(self, tracks, max_workers=ITUNES_BATCH_WORKERS):
+        """
+        Resolves many (song_title, artist_name) pairs with at most max_workers calls in flight,
+        at BACKGROUND priority so interactive and card lookups are served first.
+        """
+        # Each task gets its own context copy so the priority applies in the pool
+        with upstream_priority(BACKGROUND), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, self.get_music_track, *track)
+                for track in tracks
+            ]
+            return [f.result() for f in futures]
+
+    @fail_fast({})
+    def get_music_track(self, song_title, artist_name=""):
+        """resolve_track that returns {} instead of raising when iTunes is degraded."""
+        return self.resolve_track(song_title, artist_name)
+
+    @fail_fast("")
+    def get_music_preview_url(self, song_title, artist_name=""):
+        """Preview clip URL from the cached iTunes track record."""
+        return self.resolve_track(song_title, artist_name).get("preview_url", "")
 
+    @fail_fast("")
     @lru_cache(maxsize=2048)
     def get_movie_image_url(self, movie_title):
         """Searches TMDB for a movie poster image URL."""
@@ -110,36 +198,20 @@ class YoutubeToolset:
             tmdb_api_key = os.getenv("TMDB_API_KEY")
             if not tmdb_api_key:
                 return ""
-            res = self.session.get(
-                f"https://api.themoviedb.org/3/search/movie?api_key={tmdb_api_key}&query={movie_title}",
-                timeout=5.0,
+            res = self._get(
+                f"https://api.themoviedb.org/3/search/movie?api_key={tmdb_api_key}&query={movie_title}"
             )
             res.raise_for_status()
             data = res.json()
             if data.get("results") and data["results"][0].get("poster_path"):
                 return f"https://image.tmdb.org/t/p/w500{data['results'][0]['poster_path']}"
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Error fetching TMDB movie image: {e}")
         return ""
 
-    @lru_cache(maxsize=2048)
-    def get_music_image_url(self, song_title, artist_name=""):
-        """Searches iTunes for music artwork image URL."""
-        search_terms = []
-        if artist_name:
-            search_terms.append(f"{song_title} {artist_name}")
-        search_terms.append(song_title)
-
-        for term in search_terms:
-            try:
-                res = self.session.get(
-                    f"https://itunes.apple.com/search?term={term}&entity=song&limit=1",
-                    timeout=5.0,
-                )
-                res.raise_for_status()
-                data = res.json()
-                if data.get("results") and data["results"][0].get("artworkUrl100"):
-                    return data["results"][0]["artworkUrl100"].replace("100x100bb", "600x600bb")
-            except Exception as e:
-                print(f"Error fetching iTunes music image for '{term}': {e}")
-        return ""
\ No newline at end of file
+    @fail_fast("")
+    def get_music_image_url(self, song_title, artist_name="", size=600):
+        """Artwork URL from the cached iTunes track record."""
+        return self.resolve_track(song_title, artist_name).get("artwork", {}).get(size, "")
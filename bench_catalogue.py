@@ -0,0 +1,53 @@
+import sys
+import time
+import pandas as pd
+from app.database import DataLoader
+
+# Compares the compact catalogue produced by DataLoader.load_media against the
+# legacy all-object layout (type/genre/year as Python strings, float64 popularity).
+CACHE_DIR = sys.argv[1] if len(sys.argv) > 1 else "data_cache"
+REPEATS = 20
+
+
+def to_legacy(df):
+    legacy = pd.DataFrame(index=df.index)
+    for col in ["title", "description", "image_url", "type", "genre"]:
+        legacy[col] = df[col].astype(object)
+    legacy["year"] = [DataLoader.display_year(r) for _, r in df.iterrows()]
+    legacy["year"] = legacy["year"].astype(object)
+    legacy["popularity"] = df["popularity"].astype("float64")
+    return legacy
+
+
+def time_ms(fn):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def masks(df):
+    return {
+        "type == movie": lambda: df["type"] == "movie",
+        "title contains 'love'": lambda: df["title"].str.contains("love", case=False, na=False),
+        "title.lower() == query": lambda: df["title"].str.lower() == "inception",
+        "nlargest(250, popularity)": lambda: df.nlargest(250, "popularity"),
+    }
+
+
+compact = DataLoader.load_media(
+    f"{CACHE_DIR}/movies_metadata.csv",
+    f"{CACHE_DIR}/TMDB_movie_dataset_v11.csv",
+    f"{CACHE_DIR}/music_data.csv",
+)
+legacy = to_legacy(compact)
+
+print(f"Rows: {len(compact)}")
+print(f"Memory  legacy: {DataLoader.memory_mb(legacy):8.1f} MB")
+print(f"Memory compact: {DataLoader.memory_mb(compact):8.1f} MB")
+for name, fn in masks(legacy).items():
+    fast = masks(compact)[name]
+    print(f"{name:<28} legacy {time_ms(fn):7.2f} ms | compact {time_ms(fast):7.2f} ms")
+
+# Run this cmd to compare layouts
+# python bench_catalogue.py data_cache
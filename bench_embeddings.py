@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+import time
+from app.database import DataLoader
+from app.embedding_build import build_embeddings
+
+# Encoding throughput of app.embedding_build at different worker counts.
+# Every run starts from an empty shard directory so nothing is resumed.
+CACHE_DIR = sys.argv[1] if len(sys.argv) > 1 else "data_cache"
+SAMPLE = int(sys.argv[2]) if len(sys.argv) > 2 else 8192
+CORES = os.cpu_count() or 1
+WORKER_COUNTS = [n for n in (1, 2, 4, 8) if n <= CORES]
+
+media_df = DataLoader.load_media(
+    f"{CACHE_DIR}/movies_metadata.csv",
+    f"{CACHE_DIR}/TMDB_movie_dataset_v11.csv",
+    f"{CACHE_DIR}/music_data.csv",
+)
+descriptions = media_df["description"].fillna("").tolist()[:SAMPLE]
+print(f"{len(descriptions)} descriptions, {CORES} cores")
+
+for workers in WORKER_COUNTS:
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        build_embeddings(
+            descriptions,
+            os.path.join(tmp, "embeddings.pt"),
+            shard_dir=os.path.join(tmp, "shards"),
+            workers=workers,
+            shard_size=512,
+            threads_per_worker=max(1, CORES // workers),
+        )
+        elapsed = time.perf_counter() - start
+    # Includes process spawn and model load, which is what a real build pays
+    print(f"workers={workers:<2} {elapsed:7.1f}s  {len(descriptions) / elapsed:8.0f} descriptions/s")
+
+# Run this cmd to benchmark
+# python bench_embeddings.py data_cache 8192
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+import time
+import httpx
+
+# Starts the supervisor at 1/2/4/8 workers and reports startup time plus per-worker
+# memory. RSS counts shared mmapped pages in every process; PSS splits them between
+# the processes that map them, so PSS is the number that shows the sharing.
+PORT = 7900
+WORKER_COUNTS = [int(n) for n in sys.argv[1:]] or [1, 2, 4, 8]
+TIMEOUT = 600
+
+
+def memory_kb(pid):
+    rss = pss = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return rss, pss
+
+
+def wait_for_workers(count):
+    """Polls /health until `count` distinct worker pids have answered with a loaded catalogue."""
+    pids = set()
+    deadline = time.monotonic() + TIMEOUT
+    while len(pids) < count and time.monotonic() < deadline:
+        try:
+            health = httpx.get(f"http://127.0.0.1:{PORT}/health", timeout=2.0).json()
+            if health["items"]:
+                pids.add(health["pid"])
+        except Exception:
+            pass
+        time.sleep(0.05)
+    return pids
+
+
+print(f"{'workers':>7} {'startup s':>10} {'RSS/worker MB':>14} {'PSS/worker MB':>14}")
+for workers in WORKER_COUNTS:
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "app.supervisor", "--workers", str(workers), "--port", str(PORT)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        pids = wait_for_workers(workers)
+        elapsed = time.perf_counter() - start
+        usage = [memory_kb(pid) for pid in pids]
+        rss = sum(r for r, _ in usage) / max(len(usage), 1) / 1024
+        pss = sum(p for _, p in usage) / max(len(usage), 1) / 1024
+        print(f"{workers:>7} {elapsed:>10.1f} {rss:>14.0f} {pss:>14.0f}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+# Run this cmd to benchmark (needs the data cache and model available)
+# python bench_workers.py 1 2 4 8
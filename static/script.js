@@ -12,6 +12,25 @@ let currentQuery = '';
 let currentTrendingType = "";
 // -------------------------
 
+// --- Personalization State ---
+// One id per browser tab; the server keeps a short-lived taste profile for it
+let SESSION_ID = sessionStorage.getItem("sessionId");
+if (!SESSION_ID) {
+  SESSION_ID = crypto.randomUUID();
+  sessionStorage.setItem("sessionId", SESSION_ID);
+}
+
+function recordInteraction(itemId) {
+  if (itemId === undefined || itemId === null || itemId === "") return;
+  fetch("/interaction", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ session: SESSION_ID, item_id: Number(itemId) }),
+    keepalive: true,
+  }).catch(() => {});
+}
+// -------------------------
+
 // --- Autocomplete State ---
 const autocompleteCache = new Map();
 let focusedIndex = -1;
@@ -37,7 +56,7 @@ async function loadTrending(type, containerId) {
 
   try {
     const res = await fetch(
-      `/trending?type=${type}&limit=5`
+      `/trending?type=${type}&limit=5&session=${SESSION_ID}`
     );
     const data = await res.json();
     renderCards(
@@ -137,7 +156,7 @@ async function renderCards(
     let mediaHtml = "";
     if (item.type === "movie") {
       if (item.trailer_url) {
-        mediaHtml = `<a href="${item.trailer_url}" target="_blank" class="play-trailer-btn">▶ Play Trailer</a>`;
+        mediaHtml = `<a href="${item.trailer_url}" target="_blank" class="play-trailer-btn" onclick="recordInteraction(${item.id})">▶ Play Trailer</a>`;
       } else {
         mediaHtml = `<button class="play-trailer-btn disabled" disabled>🚫 Trailer N/A</button>`;
       }
@@ -151,7 +170,8 @@ async function renderCards(
                 <button class="custom-play-btn"
                         data-audio-id="${audioId}"
                         data-title="${item.title}"
-                        data-artist="${item.year}">
+                        data-artist="${item.year}"
+                        data-id="${item.id}">
                     ▶ Play Preview
                 </button>
             </div>
@@ -249,6 +269,7 @@ function attachAudioPlayerListeners() {
         } else {
           // If there's no audio element yet, create and play it
           button.textContent = "⌛ Loading...";
+          recordInteraction(button.dataset.id);
           try {
             const title = button.dataset.title;
             const artist =
@@ -412,6 +433,7 @@ async function autocomplete(query) {
 
 function selectSuggestion(index) { // Changed parameter to index
   const item = autocompleteSuggestions[index]; // Get the full item from the array
+  recordInteraction(item.id);
   document.getElementById('userInput').value = item.title;
   document.getElementById('suggestions-list').style.display = 'none';
   clearSuggestions(); // Clear suggestions after selection
@@ -454,7 +476,7 @@ async function displaySingleMediaCard(item) {
       let mediaHtml = "";
       if (fullItem.type === "movie") {
         if (fullItem.trailer_url) {
-          mediaHtml = `<a href="${fullItem.trailer_url}" target="_blank" class="play-trailer-btn">▶ Play Trailer</a>`;
+          mediaHtml = `<a href="${fullItem.trailer_url}" target="_blank" class="play-trailer-btn" onclick="recordInteraction(${fullItem.id})">▶ Play Trailer</a>`;
         } else {
           mediaHtml = `<button class="play-trailer-btn disabled" disabled>🚫 Trailer N/A</button>`;
         }
@@ -466,7 +488,8 @@ async function displaySingleMediaCard(item) {
                   <button class="custom-play-btn"
                           data-audio-id="${audioId}"
                           data-title="${fullItem.title}"
-                          data-artist="${fullItem.year}">
+                          data-artist="${fullItem.year}"
+                          data-id="${fullItem.id}">
                       ▶ Play Preview
                   </button>
               </div>
@@ -633,11 +656,11 @@ async function loadMoreData() {
 
   let url = "";
   if (currentView === "trending") {
-    url = `/trending?type=${currentTrendingType}&page=${currentPage}`;
+    url = `/trending?type=${currentTrendingType}&page=${currentPage}&session=${SESSION_ID}`;
   } else if (currentView === "search") {
     url = `/search?q=${encodeURIComponent(
       currentQuery
-    )}&type=${currentType}&page=${currentPage}`;
+    )}&type=${currentType}&page=${currentPage}&session=${SESSION_ID}`;
   } else {
     isLoading = false;
     return;
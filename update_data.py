@@ -1,24 +1,68 @@
+import argparse
+import hashlib
+import json
 import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import pandas as pd
 import requests
-from huggingface_hub import HfApi, hf_hub_download
-from app.engine import RecommendationEngine
+from huggingface_hub import CommitOperationAdd, HfApi, hf_hub_download
+from app.database import DataLoader
 
 # Config Constants
 TMDB_KEY = os.getenv("TMDB_API_KEY")
 HF_TOKEN = os.getenv("HF_TOKEN")
 REPO_ID = "tuannho080213/media_data"
 CACHE_DIR = "data_cache"
+FIXTURES_DIR = os.path.join("fixtures", "sync")
 
 # SonarQube Fix: Defined constants for duplicated literals
 MUSIC_DATA_FILE = "music_data.csv"
 MOVIES_DATA_FILE = "TMDB_movie_dataset_v11.csv"
 EMBEDDINGS_FILE = "media_embeddings.pt"
+SHARD_DIR = os.path.join(CACHE_DIR, "embedding_shards")
 
-def fetch_trending_movies():
+MUSIC_TERMS = ["2024", "2025", "Billboard", "Indie", "Top100"]
+FETCH_WORKERS = 4
+REQUEST_TIMEOUT = 10.0
+CSV_CHUNK_ROWS = 50_000
+
+stage_timings = {}
+
+
+@contextmanager
+def stage(name):
+    print(f"\n▶️ {name}...")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_timings[name] = time.perf_counter() - start
+        print(f"⏱️ {name}: {stage_timings[name]:.2f}s")
+
+
+# --- 1. UPSTREAM FETCH ---
+def _get_json(url, fixture=None):
+    """GETs a JSON payload, or reads it from a fixture file in dry-run mode."""
+    if fixture is not None:
+        with open(fixture, "r", encoding="utf-8") as f:
+            return json.load(f)
+    res = requests.get(url, timeout=REQUEST_TIMEOUT)
+    res.raise_for_status()
+    return res.json()
+
+
+def fetch_trending_movies(fixtures_dir=None):
     print("Fetching trending movies from TMDB...")
     url = f"https://api.themoviedb.org/3/trending/movie/day?api_key={TMDB_KEY}"
-    res = requests.get(url).json()
+    fixture = os.path.join(fixtures_dir, "tmdb_trending.json") if fixtures_dir else None
+    try:
+        res = _get_json(url, fixture)
+    except Exception as e:
+        print(f"⚠️ TMDB trending fetch failed: {e}")
+        res = {}
     new_movies = []
     for m in res.get("results", []):
         poster_url = (
@@ -38,92 +82,235 @@ def fetch_trending_movies():
     return pd.DataFrame(new_movies)
 
 
-def fetch_new_music():
+def _fetch_music_term(term, fixtures_dir=None):
+    url = f"https://itunes.apple.com/search?term={term}&entity=song&limit=50"
+    fixture = os.path.join(fixtures_dir, "itunes_search.json") if fixtures_dir else None
+    try:
+        res = _get_json(url, fixture)
+    except Exception as e:
+        print(f"⚠️ iTunes fetch failed for '{term}': {e}")
+        return []
+    return [
+        {
+            "track_name": t.get("trackName"),
+            "artist": t.get("artistName"),  # Matches your CSV column 'artist'
+            "album_cover_url": t.get("artworkUrl100"),
+            "popularity": 90,
+            "track_genre": t.get("primaryGenreName"),
+        }
+        for t in res.get("results", [])
+    ]
+
+
+def fetch_new_music(fixtures_dir=None):
     print("Fetching 2024-2025 hits from iTunes...")
-    tracks = []
-    for year in ["2024", "2025", "Billboard", "Indie", "Top100"]:
-        url = f"https://itunes.apple.com/search?term={year}&entity=song&limit=50"
-        res = requests.get(url).json()
-        for t in res.get("results", []):
-            tracks.append(
-                {
-                    "track_name": t.get("trackName"),
-                    "artist": t.get("artistName"),  # Matches your CSV column 'artist'
-                    "album_cover_url": t.get("artworkUrl100"),
-                    "popularity": 90,
-                    "track_genre": t.get("primaryGenreName"),
-                }
-            )
+    # Bounded fan-out keeps us polite to iTunes while not waiting on terms one by one
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        per_term = pool.map(lambda term: _fetch_music_term(term, fixtures_dir), MUSIC_TERMS)
+        tracks = [track for batch in per_term for track in batch]
     return pd.DataFrame(tracks)
 
 
-def sync():
-    api = HfApi(token=HF_TOKEN)
-    os.makedirs(CACHE_DIR, exist_ok=True)
+# --- 2. STREAMING MERGE ---
+def _row_hashes(df, key_cols):
+    keys = df.reindex(columns=key_cols).fillna("").astype(str)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
 
-    # 1. DOWNLOAD CURRENT DATA INTO CACHE
-    print("Downloading current files...")
-    music_path = hf_hub_download(
-        repo_id=REPO_ID,
-        filename=MUSIC_DATA_FILE,
-        repo_type="dataset",
-        local_dir=CACHE_DIR,
+
+def merge_csv(existing_path, new_rows, key_cols, out_path):
+    """
+    Streams the existing CSV in chunks to out_path, then appends unseen new rows.
+    Rows are deduplicated on key_cols through a set of 64-bit row hashes (first wins),
+    and existing values are kept as raw text so they are never re-typed on the way through.
+    Returns the number of rows added.
+    """
+    existing_cols = list(pd.read_csv(existing_path, nrows=0).columns)
+    out_cols = existing_cols + [c for c in new_rows.columns if c not in existing_cols]
+    seen = set()
+    tmp_path = f"{out_path}.tmp"
+
+    def write_unseen(chunk, header):
+        hashes = _row_hashes(chunk, key_cols)
+        keep = []
+        for h in hashes:
+            keep.append(h not in seen)
+            seen.add(h)
+        chunk = chunk[keep].reindex(columns=out_cols)
+        chunk.to_csv(tmp_path, mode="w" if header else "a", header=header, index=False)
+        return len(chunk)
+
+    first = True
+    for chunk in pd.read_csv(
+        existing_path, chunksize=CSV_CHUNK_ROWS, dtype=str, keep_default_na=False
+    ):
+        write_unseen(chunk, first)
+        first = False
+    added = write_unseen(new_rows.fillna("").astype(str), first) if len(new_rows) else 0
+    os.replace(tmp_path, out_path)
+    return added
+
+
+# --- 3. EMBEDDINGS ---
+def build_index(movie_path, music_path, embeddings_path, shard_dir=SHARD_DIR, workers=None):
+    from app.embedding_build import build_embeddings, catalogue_shard_dir
+
+    sources = [movie_path, movie_path, music_path]
+    media_df = DataLoader.load_media(*sources)
+    descriptions = media_df["description"].fillna("").tolist()
+    print(f"🔄 Building search index for {len(descriptions)} items...")
+    build_embeddings(
+        descriptions,
+        embeddings_path,
+        shard_dir=catalogue_shard_dir(sources, shard_dir),
+        workers=workers,
     )
-    movie_path = hf_hub_download(
+
+
+# --- 4. UPLOAD ---
+def _git_blob_sha1(path):
+    sha = hashlib.sha1()
+    sha.update(f"blob {os.path.getsize(path)}\0".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def changed_files(api, files):
+    """Keeps (local_path, repo_path) pairs whose content differs from the copy on the Hub."""
+    remote = {
+        info.path: info
+        for info in api.get_paths_info(
+            REPO_ID, [repo for _, repo in files], repo_type="dataset"
+        )
+    }
+    changed = []
+    for local_file, repo_file in files:
+        info = remote.get(repo_file)
+        if info is not None:
+            lfs = getattr(info, "lfs", None)
+            if lfs is not None and lfs.sha256 == _sha256(local_file):
+                print(f"⏭️ {repo_file} unchanged, skipping upload.")
+                continue
+            if lfs is None and getattr(info, "blob_id", None) == _git_blob_sha1(local_file):
+                print(f"⏭️ {repo_file} unchanged, skipping upload.")
+                continue
+        changed.append((local_file, repo_file))
+    return changed
+
+
+def upload(api, files, dry_run=False, fixtures_dir=FIXTURES_DIR):
+    files = [(local, repo) for local, repo in files if os.path.exists(local)]
+    if dry_run:
+        # The fixtures stand in for the Hub copies
+        for local_file, repo_file in files:
+            remote_copy = os.path.join(fixtures_dir, repo_file)
+            if os.path.exists(remote_copy) and _sha256(remote_copy) == _sha256(local_file):
+                print(f"⏭️ {repo_file} unchanged, skipping upload.")
+            else:
+                print(f"🧪 Dry run: would upload {local_file} -> {repo_file}")
+        return
+    files = changed_files(api, files)
+    if not files:
+        print("Nothing changed, no upload needed.")
+        return
+    # One commit for all changed artifacts instead of one per file
+    api.create_commit(
         repo_id=REPO_ID,
-        filename=MOVIES_DATA_FILE,
         repo_type="dataset",
-        local_dir=CACHE_DIR,
+        operations=[
+            CommitOperationAdd(path_in_repo=repo_file, path_or_fileobj=local_file)
+            for local_file, repo_file in files
+        ],
+        commit_message=f"Daily sync: {', '.join(repo for _, repo in files)}",
     )
+    print(f"Uploaded {len(files)} file(s).")
 
-    music_df = pd.read_csv(music_path)
-    movie_df = pd.read_csv(movie_path)
 
-    # 2. FETCH NEW CONTENT
-    new_music = fetch_new_music()
-    new_movies = fetch_trending_movies()
+def sync(dry_run=False, fixtures_dir=FIXTURES_DIR, skip_embeddings=False, workers=None):
+    api = None if dry_run else HfApi(token=HF_TOKEN)
+    work_dir = os.path.join(CACHE_DIR, "dry_run") if dry_run else CACHE_DIR
+    os.makedirs(work_dir, exist_ok=True)
+    embeddings_path = os.path.join(work_dir, EMBEDDINGS_FILE) if dry_run else EMBEDDINGS_FILE
+    # build_embeddings prunes shards outside its plan, so a dry run must not share the real checkpoints
+    shard_dir = os.path.join(work_dir, "embedding_shards") if dry_run else SHARD_DIR
+    upstream_fixtures = fixtures_dir if dry_run else None
 
-    # 3. MERGE & DEDUPLICATE
-    updated_music = pd.concat([music_df, new_music]).drop_duplicates(
-        subset=["track_name", "artist"], keep="first"
-    )
-    updated_movies = pd.concat([movie_df, new_movies]).drop_duplicates(
-        subset=["title"], keep="first"
-    )
+    # 1. DOWNLOAD CURRENT DATA INTO CACHE
+    with stage("Download"):
+        if dry_run:
+            music_path = shutil.copy(os.path.join(fixtures_dir, MUSIC_DATA_FILE), work_dir)
+            movie_path = shutil.copy(os.path.join(fixtures_dir, MOVIES_DATA_FILE), work_dir)
+        else:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                music_path, movie_path = pool.map(
+                    lambda name: hf_hub_download(
+                        repo_id=REPO_ID,
+                        filename=name,
+                        repo_type="dataset",
+                        local_dir=CACHE_DIR,
+                    ),
+                    [MUSIC_DATA_FILE, MOVIES_DATA_FILE],
+                )
 
-    # 4. SAVE TO THE CACHE FOLDER
-    music_save_path = os.path.join(CACHE_DIR, MUSIC_DATA_FILE)
-    movie_save_path = os.path.join(CACHE_DIR, MOVIES_DATA_FILE)
-    updated_music.to_csv(music_save_path, index=False)
-    updated_movies.to_csv(movie_save_path, index=False)
-
-    # 5. GENERATE EMBEDDINGS
-    print("🔄 Generating fresh search index...")
-    engine = RecommendationEngine()
-    # Using the constants to build paths
-    engine.init_data(movie_save_path, movie_save_path, music_save_path)
-
-    # 6. UPLOAD EVERYTHING
-    # Using constants for filenames in repo
-    files_to_push = [
-        (EMBEDDINGS_FILE, EMBEDDINGS_FILE),
-        (music_save_path, MUSIC_DATA_FILE),
-        (movie_save_path, MOVIES_DATA_FILE),
-    ]
+    # 2. FETCH NEW CONTENT (both upstreams at once)
+    with stage("Fetch"):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            music_future = pool.submit(fetch_new_music, upstream_fixtures)
+            movies_future = pool.submit(fetch_trending_movies, upstream_fixtures)
+            new_music, new_movies = music_future.result(), movies_future.result()
+        print(f"Fetched {len(new_music)} tracks and {len(new_movies)} movies.")
 
-    for local_file, repo_file in files_to_push:
-        if os.path.exists(local_file):
-            print(f"Uploading {repo_file}...")
-            api.upload_file(
-                path_or_fileobj=local_file,
-                path_in_repo=repo_file,
-                repo_id=REPO_ID,
-                repo_type="dataset",
-            )
-        else:
-            print(f"⚠️ Warning: {local_file} not found, skipping upload.")
+    # 3. MERGE & DEDUPLICATE INTO THE CACHE FOLDER
+    with stage("Merge"):
+        music_save_path = os.path.join(work_dir, MUSIC_DATA_FILE)
+        movie_save_path = os.path.join(work_dir, MOVIES_DATA_FILE)
+        added_music = merge_csv(music_path, new_music, ["track_name", "artist"], music_save_path)
+        added_movies = merge_csv(movie_path, new_movies, ["title"], movie_save_path)
+        print(f"Added {added_music} new tracks and {added_movies} new movies.")
+
+    # 4. GENERATE EMBEDDINGS
+    if skip_embeddings:
+        print("Skipping embedding build.")
+    else:
+        with stage("Embed"):
+            build_index(movie_save_path, music_save_path, embeddings_path, shard_dir, workers)
 
+    # 5. UPLOAD CHANGED ARTIFACTS
+    with stage("Upload"):
+        artifacts = [(music_save_path, MUSIC_DATA_FILE), (movie_save_path, MOVIES_DATA_FILE)]
+        # A local .pt left from an earlier run doesn't match the CSVs just merged
+        if not skip_embeddings:
+            artifacts.insert(0, (embeddings_path, EMBEDDINGS_FILE))
+        upload(
+            api,
+            artifacts,
+            dry_run=dry_run,
+            fixtures_dir=fixtures_dir,
+        )
+
+    print("\n📊 Stage timings: " + ", ".join(f"{k} {v:.2f}s" for k, v in stage_timings.items()))
     print("✅ All data and embeddings synced successfully!")
 
+
 if __name__ == "__main__":
-    sync()
+    parser = argparse.ArgumentParser(description="Nightly catalogue sync to the Hugging Face dataset.")
+    parser.add_argument("--dry-run", action="store_true", help="Use local fixtures, never touch the network or Hub.")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Fixture directory for --dry-run.")
+    parser.add_argument("--skip-embeddings", action="store_true", help="Skip the embedding build stage.")
+    parser.add_argument("--workers", type=int, default=None, help="Embedding worker processes.")
+    args = parser.parse_args()
+    sync(
+        dry_run=args.dry_run,
+        fixtures_dir=args.fixtures,
+        skip_embeddings=args.skip_embeddings,
+        workers=args.workers,
+    )